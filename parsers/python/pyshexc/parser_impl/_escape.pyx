@@ -0,0 +1,142 @@
+# cython: language_level=3
+# Copyright (c) 2017, Mayo Clinic
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+#     list of conditions and the following disclaimer.
+#
+#     Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+#
+#     Neither the name of the Mayo Clinic nor the names of its contributors
+#     may be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+""" Optional compiled versions of ParserContext.fix_text_escapes and ParserContext.fix_re_escapes.
+
+Both functions make a single pass over the text, writing into a buffer that is never longer than the input.
+parser_context falls back to its pure Python implementation when this module has not been built.
+"""
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+
+cdef extern from "Python.h":
+    int PyUnicode_4BYTE_KIND
+    object PyUnicode_FromKindAndData(int kind, const void *buffer, Py_ssize_t size)
+
+# Character following a '\' in a string literal -> replacement character.  0 means "not an ECHAR - leave the
+# escape alone".  UCHARs (\uXXXX and \UXXXXXXXX) are decoded separately - one beyond 0x10FFFF is left alone too
+cdef Py_UCS4 _text_map[128]
+# Character following a '\' in a regular expression -> letter to keep escaped.  0 means "drop the backslash"
+cdef Py_UCS4 _re_map[128]
+
+
+cdef void _init_maps():
+    cdef Py_UCS4 c
+    for c in 'bfnrt':
+        _text_map[c] = '\b\f\n\r\t'['bfnrt'.index(c)]
+        _re_map[c] = c
+    for c in '\b\f\n\r\t':
+        _re_map[c] = 'bfnrt'['\b\f\n\r\t'.index(c)]
+    for c in '\\.?*+^$()[]{|}':
+        _re_map[c] = c
+    for c in '\\"\'':
+        _text_map[c] = c
+
+_init_maps()
+
+
+cdef long long _hex_value(str txt, Py_ssize_t start, Py_ssize_t ndigits):
+    """ Return the value of the ndigits hex digits at txt[start:], -1 if there aren't that many """
+    cdef long long rval = 0
+    cdef Py_UCS4 c
+    cdef Py_ssize_t i
+    if start + ndigits > len(txt):
+        return -1
+    for i in range(start, start + ndigits):
+        c = txt[i]
+        if '0' <= c <= '9':
+            rval = rval * 16 + (<long long> c - 48)
+        elif 'a' <= c <= 'f':
+            rval = rval * 16 + (<long long> c - 87)
+        elif 'A' <= c <= 'F':
+            rval = rval * 16 + (<long long> c - 55)
+        else:
+            return -1
+    return rval
+
+
+cdef str _unescape(str txt, bint regex):
+    cdef Py_ssize_t n = len(txt)
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t j = 0
+    cdef Py_UCS4 c
+    cdef Py_UCS4 m
+    cdef long long u
+    cdef Py_ssize_t ndigits
+    cdef Py_UCS4 *buf
+
+    if n == 0:
+        return txt
+    buf = <Py_UCS4 *> PyMem_Malloc(n * sizeof(Py_UCS4))
+    if not buf:
+        raise MemoryError()
+    try:
+        while i < n:
+            c = txt[i]
+            i += 1
+            if c == '\\' and i < n:
+                c = txt[i]
+                i += 1
+                if c < 128:
+                    m = _re_map[c] if regex else _text_map[c]
+                else:
+                    m = 0
+                if regex:
+                    if m:
+                        buf[j] = '\\'
+                        j += 1
+                        c = m
+                elif m:
+                    c = m
+                else:
+                    ndigits = 4 if c == 'u' else 8 if c == 'U' else 0
+                    u = _hex_value(txt, i, ndigits) if ndigits else -1
+                    if 0 <= u <= 0x10FFFF:
+                        c = <Py_UCS4> u
+                        i += ndigits
+                    else:
+                        buf[j] = '\\'
+                        j += 1
+            buf[j] = c
+            j += 1
+        return PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, buf, j)
+    finally:
+        PyMem_Free(buf)
+
+
+def fix_text_escapes(str txt, str quote_char) -> str:
+    """ Fix the various text escapes - decode ECHARs and UCHARs, leave anything else alone.  quote_char is unused """
+    return _unescape(txt, False)
+
+
+def fix_re_escapes(str txt) -> str:
+    """ The ShEx RE engine allows escaping any character.  We have to remove that escape for everything except those
+    that CAN be legitimately escaped
+
+    :param txt: text to be escaped
+    """
+    return _unescape(txt, True)
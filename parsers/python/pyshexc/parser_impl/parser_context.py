@@ -26,13 +26,19 @@
 # OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 # OF THE POSSIBILITY OF SUCH DAMAGE.
 import re
-from typing import Union
+import sys
+from typing import Optional, Union
 from rdflib import RDF, XSD
 
 from pyshexc.parser.ShExDocParser import ShExDocParser
 from ShExJSG import ShExJ
 from pyjsg.jsglib import jsg
 
+try:
+    from pyshexc.parser_impl import _escape     # Optional compiled escape scanner - see _escape.pyx
+except ImportError:
+    _escape = None
+
 IRIstr = str
 PREFIXstr = str
 
@@ -43,68 +49,138 @@ RDF_DOUBLE_TYPE = ShExJ.IRIREF(str(XSD.double))
 RDF_DECIMAL_TYPE = ShExJ.IRIREF(str(XSD.decimal))
 RDF_BOOL_TYPE = ShExJ.IRIREF(str(XSD.boolean))
 
+# numericLiteral token type -> (jsg type, python type, RDF type)
+_NUMERIC_LITERALS = {ShExDocParser.INTEGER: (jsg.Integer, int, RDF_INTEGER_TYPE),
+                     ShExDocParser.DECIMAL: (jsg.Number, float, RDF_DECIMAL_TYPE),
+                     ShExDocParser.DOUBLE: (jsg.Number, float, RDF_DOUBLE_TYPE)}
+
+_ESC_RE = re.compile(r'\\.', re.MULTILINE | re.DOTALL | re.UNICODE)
+_TEXT_ESC_RE = re.compile(r'\\(?:u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)', re.MULTILINE | re.DOTALL | re.UNICODE)
+# ECHAR -> character.  Same table as the shex.js stringEscapeReplacements
+_ESC_MAP = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', '\\': '\\', '"': '"', "'": "'"}
+# Regular expression escapes that are kept (control characters are re-escaped by name) - all others drop the '\'
+_RE_ESC_MAP = dict([(c, '\\' + c) for c in 'bfnrt\\.?*+^$()[]{|}'] +
+                   [(v, '\\' + k) for k, v in zip('bfnrt', '\b\f\n\r\t')])
+_TRIPLE_QUOTES = ("'''", '"""')
+_MAX_CODE_POINT = 0x10FFFF             # Largest code point a UCHAR can decode to
+_UCHAR_RE = re.compile(r'\\(?:u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8})')
+
+
+def _decode_uchar(esc: str) -> Optional[str]:
+    """ Return the character represented by UCHAR esc ('\\uXXXX' or '\\UXXXXXXXX'), None if it is beyond the Unicode
+    range """
+    code_point = int(esc[2:], 16)
+    return chr(code_point) if code_point <= _MAX_CODE_POINT else None
+
+
+def _text_escape_subf(matchobj, _map=_ESC_MAP) -> str:
+    """ Replace a single ECHAR or UCHAR escape sequence with the character it represents.  Anything else (not legal
+    in a ShExC string), including a UCHAR beyond the Unicode range, is left as is """
+    esc = matchobj.group(0)
+    if len(esc) > 2:
+        return _decode_uchar(esc) or esc
+    return _map.get(esc[1], esc)
+
+
+def _re_escape_subf(matchobj, _map=_RE_ESC_MAP) -> str:
+    """ Keep the escape on a regular expression character that can legitimately be escaped, drop it otherwise """
+    c = matchobj.group(0)[1]
+    return _map.get(c, c)
+
+
+def _iri_uchar_subf(matchobj) -> str:
+    """ Replace a single UCHAR escape sequence in an IRIREF with the character it represents """
+    esc = matchobj.group(0)
+    rval = _decode_uchar(esc)
+    if rval is None:
+        raise ValueError("IRIREF UCHAR {} not in range(0x110000)".format(esc))
+    return rval
+
 
 class ParserContext:
     """
     Context maintained across ShExC parser implementation modules
     """
+    __slots__ = ('schema', 'ld_prefixes', 'prefixes', 'base', '_lookup', '_irirefs')
+
     def __init__(self):
         self.schema = ShExJ.Schema()
         self.ld_prefixes = {}       # Dict[PREFIXstr, IRIstr] - prefixes in the JSON-LD module
-        self.prefixes = {}          # Dict[PREFIXstr, IRIstr]
+        self.prefixes = {}          # Dict[PREFIXstr, IRIstr] - PREFIXstr excludes the trailing ':'
         self.base = None            # IRIstr
+        self._lookup = {}           # Dict[PREFIXstr, IRIstr] - see finalize_prefixes
+        self._irirefs = {}          # Dict[IRIstr, ShExJ.IRIREF] - see _iriref
+        self.finalize_prefixes()
+
+    def finalize_prefixes(self) -> None:
+        """ Fold the JSON-LD and ShEx prefixes into the single table used by _lookup_prefix.  Must be invoked
+        whenever ld_prefixes or prefixes change """
+        self._lookup = dict(self.prefixes)
+        self._lookup.update(self.ld_prefixes)
+
+    def add_prefix(self, prefix: PREFIXstr, iri: IRIstr) -> None:
+        """ Record a PREFIX declaration.  The first declaration of a prefix wins.  The prefix and namespace are
+        interned (sys.intern), so every IRI that resolves to just the namespace (e.g. 'ex:') shares one string """
+        self.prefixes.setdefault(sys.intern(prefix), sys.intern(iri))
+        self.finalize_prefixes()
+
+    def _iriref(self, iri: IRIstr) -> ShExJ.IRIREF:
+        """ Return the ShExJ.IRIREF for iri, shared by every reference to iri in the schema being parsed """
+        rval = self._irirefs.get(iri)
+        if rval is None:
+            rval = self._irirefs[iri] = ShExJ.IRIREF(iri)
+        return rval
 
     def _lookup_prefix(self, prefix: PREFIXstr) -> str:
-        if len(prefix) == 0:
-            return self.base
-        elif prefix in self.ld_prefixes:
-            return self.ld_prefixes[prefix]
-        else:
-            return self.prefixes.get(prefix, "")
+        return self._lookup.get(prefix, "")
 
     def iriref_to_str(self, ref: ShExDocParser.IRIREF) -> str:
         """ IRIREF: '<' (~[\u0000-\u0020=<>\"{}|^`\\] | UCHAR)* '>' """
-        rval = ref.getText()[1:-1].encode('utf-8').decode('unicode-escape')
-        return rval if ':' in rval or not self.base else self.base.val + rval
+        rval = _UCHAR_RE.sub(_iri_uchar_subf, ref.getText()[1:-1])
+        return rval if not self.base or ':' in rval else self.base.val + rval
 
     def iriref_to_shexj_iriref(self, ref: ShExDocParser.IRIREF) -> ShExJ.IRIREF:
         """  IRIREF: '<' (~[\u0000-\u0020=<>\"{}|^`\\] | UCHAR)* '>'
              IRI: (PN_CHARS | '!' | ''.' | ':' | '/' | '\\' | '#' | '@' | '%' | '&' | UCHAR)* """
-        return ShExJ.IRIREF(self.iriref_to_str(ref))
+        return self._iriref(self.iriref_to_str(ref))
 
     def prefixedname_to_str(self, prefix: ShExDocParser.PrefixedNameContext) -> str:
         """ prefixedName: PNAME_LN | PNAME_NS
             PNAME_NS: PN_PREFIX? ':' ;
             PNAME_LN: PNAME_NS PN_LOCAL ;
         """
-        if prefix.PNAME_NS():
-            return self._lookup_prefix(prefix.PNAME_NS().getText())
+        pname_ns = prefix.PNAME_NS()
+        if pname_ns:
+            return self._lookup_prefix(pname_ns.getText()[:-1])
         else:
-            prefix, local = prefix.PNAME_LN().getText().split(':', 1)
-            return self._lookup_prefix(prefix + ':') + (local if local else "")
+            prefix, _, local = prefix.PNAME_LN().getText().partition(':')
+            return self._lookup_prefix(prefix) + local
 
     def prefixedname_to_iriref(self, prefix: ShExDocParser.PrefixedNameContext) -> ShExJ.IRIREF:
         """ prefixedName: PNAME_LN | PNAME_NS
             PNAME_NS: PN_PREFIX? ':' ;
             PNAME_LN: PNAME_NS PN_LOCAL ;
         """
-        return ShExJ.IRIREF(self.prefixedname_to_str(prefix))
+        return self._iriref(self.prefixedname_to_str(prefix))
 
     def shapeRef_to_iriref(self, ref: ShExDocParser.ShapeRefContext) -> ShExJ.IRIREF:
         """ shapeRef: ATPNAME_NS | ATPNAME_LN | '@' shapeExprLabel """
-        if ref.ATPNAME_NS():
-            return ShExJ.IRIREF(self._lookup_prefix(ref.ATPNAME_NS().getText()[1:]))
-        elif ref.ATPNAME_LN():
-            prefix, local = ref.ATPNAME_LN().getText()[1:].split(':', 1)
-            return ShExJ.IRIREF(self._lookup_prefix(prefix + ':') + (local if local else ""))
+        atpname_ns = ref.ATPNAME_NS()
+        if atpname_ns:
+            return self._iriref(self._lookup_prefix(atpname_ns.getText()[1:-1]))
+        atpname_ln = ref.ATPNAME_LN()
+        if atpname_ln:
+            prefix, _, local = atpname_ln.getText()[1:].partition(':')
+            return self._iriref(self._lookup_prefix(prefix) + local)
         else:
             return self.shapeexprlabel_to_IRI(ref.shapeExprLabel())
 
     def iri_to_str(self, iri_: ShExDocParser.IriContext) -> str:
         """ iri: IRIREF | prefixedName 
         """
-        if iri_.IRIREF():
-            return self.iriref_to_str(iri_.IRIREF())
+        iriref = iri_.IRIREF()
+        if iriref:
+            return self.iriref_to_str(iriref)
         else:
             return self.prefixedname_to_str(iri_.prefixedName())
 
@@ -112,51 +188,56 @@ class ParserContext:
         """ iri: IRIREF | prefixedName 
             prefixedName: PNAME_LN | PNAME_NS 
         """
-        return ShExJ.IRIREF(self.iri_to_str(iri_))
+        iriref = iri_.IRIREF()
+        if iriref:
+            return self.iriref_to_shexj_iriref(iriref)
+        else:
+            return self.prefixedname_to_iriref(iri_.prefixedName())
 
     def tripleexprlabel_to_iriref(self, tripleExprLabel: ShExDocParser.TripleExprLabelContext) \
             -> Union[ShExJ.BNODE, ShExJ.IRIREF]:
         """ tripleExprLabel: iri | blankNode """
-        if tripleExprLabel.iri():
-            return self.iri_to_iriref(tripleExprLabel.iri())
+        iri_ = tripleExprLabel.iri()
+        if iri_:
+            return self.iri_to_iriref(iri_)
         else:
             return ShExJ.BNODE(tripleExprLabel.blankNode().getText())
 
     def shapeexprlabel_to_IRI(self, shapeExprLabel: ShExDocParser.ShapeExprLabelContext) \
             -> Union[ShExJ.BNODE, ShExJ.IRIREF]:
         """ shapeExprLabel: iri | blankNode """
-        if shapeExprLabel.iri():
-            return self.iri_to_iriref(shapeExprLabel.iri())
+        iri_ = shapeExprLabel.iri()
+        if iri_:
+            return self.iri_to_iriref(iri_)
         else:
             return ShExJ.BNODE(shapeExprLabel.blankNode().getText())
 
     def predicate_to_IRI(self, predicate: ShExDocParser.PredicateContext) -> ShExJ.IRIREF:
         """ predicate: iri | rdfType """
-        if predicate.iri():
-            return self.iri_to_iriref(predicate.iri())
+        iri_ = predicate.iri()
+        if iri_:
+            return self.iri_to_iriref(iri_)
         else:
             return RDF_TYPE
 
     @staticmethod
     def numeric_literal_to_type(numlit: ShExDocParser.NumericLiteralContext) -> Union[jsg.Integer, jsg.Number]:
         """ numericLiteral: INTEGER | DECIMAL | DOUBLE """
-        if numlit.INTEGER():
-            rval = jsg.Integer(str(int(numlit.INTEGER().getText())))
-        elif numlit.DECIMAL():
-            rval = jsg.Number(str(float(numlit.DECIMAL().getText())))
-        else:
-            rval = jsg.Number(str(float(numlit.DOUBLE().getText())))
-        return rval
+        token = numlit.start
+        jsg_type, py_type, _ = _NUMERIC_LITERALS[token.type]
+        return jsg_type(str(py_type(token.text)))
 
     def literal_to_ObjectLiteral(self, literal: ShExDocParser.LiteralContext) -> ShExJ.ObjectLiteral:
         """ literal: rdfLiteral | numericLiteral | booleanLiteral """
         rval = ShExJ.ObjectLiteral()
-        if literal.rdfLiteral():
-            rdflit = literal.rdfLiteral()
+        rdflit = literal.rdfLiteral()
+        numlit = literal.numericLiteral() if not rdflit else None
+        boollit = literal.booleanLiteral() if not rdflit and not numlit else None
+        if rdflit:
             txt = rdflit.string().getText()
             quote_char = ''
-            if len(txt) > 5 and (txt.startswith("'''") and txt.endswith("'''") or
-                                 txt.startswith('"""') and txt.endswith('"""')):
+            triple = txt[:3]
+            if len(txt) > 5 and triple in _TRIPLE_QUOTES and txt[-3:] == triple:
                 txt = txt[3:-3]
             else:
                 quote_char = txt[0]
@@ -164,41 +245,38 @@ class ParserContext:
 
             txt = self.fix_text_escapes(txt, quote_char)
             rval.value = jsg.String(txt)
-            if rdflit.LANGTAG():
-                rval.language = ShExJ.LANGTAG(rdflit.LANGTAG().getText()[1:].lower())
-            if rdflit.datatype():
-                rval.type = self.iri_to_str(rdflit.datatype().iri())
-        elif literal.numericLiteral():
-            numlit = literal.numericLiteral()
-            if numlit.INTEGER():
-                rval.value = jsg.String(numlit.INTEGER().getText())
-                rval.type = RDF_INTEGER_TYPE
-            elif numlit.DECIMAL():
-                rval.value = jsg.String(numlit.DECIMAL().getText())
-                rval.type = RDF_DECIMAL_TYPE
-            elif numlit.DOUBLE():
-                rval.value = jsg.String(numlit.DOUBLE().getText())
-                rval.type = RDF_DOUBLE_TYPE
-        elif literal.booleanLiteral():
-            rval.value = jsg.String(literal.booleanLiteral().getText().lower())
+            langtag = rdflit.LANGTAG()
+            if langtag:
+                rval.language = ShExJ.LANGTAG(langtag.getText()[1:].lower())
+            datatype = rdflit.datatype()
+            if datatype:
+                rval.type = self.iri_to_iriref(datatype.iri())
+        elif numlit:
+            token = numlit.start
+            rval.value = jsg.String(token.text)
+            rval.type = _NUMERIC_LITERALS[token.type][2]
+        elif boollit:
+            rval.value = jsg.String(boollit.getText().lower())
             rval.type = RDF_BOOL_TYPE
         return rval
 
     @staticmethod
     def is_empty_shape(sh: ShExJ.Shape) -> bool:
         """ Determine whether sh has any value """
-        return sh.closed is None and sh.expression is None and sh.extra is None and \
+        return sh.expression is None and sh.closed is None and sh.extra is None and \
             sh.semActs is None
 
-    re_trans_table = str.maketrans('bfnrt', '\b\f\n\r\t')
-
     def fix_text_escapes(self, txt: str, quote_char: str) -> str:
-        """ Fix the various text escapes """
-        def _subf(matchobj):
-            return matchobj.group(0).translate(self.re_trans_table)
-        if quote_char:
-            txt = re.sub(r'\\'+quote_char, quote_char, txt)
-        return re.sub(r'\\.', _subf, txt, flags=re.MULTILINE + re.DOTALL + re.UNICODE)
+        """ Fix the various text escapes
+
+        :param txt: text to be unescaped
+        :param quote_char: enclosing quote character.  Unused - escaped quotes are ECHARs and are decoded with the rest
+        """
+        if '\\' not in txt:
+            return txt
+        if _escape:
+            return _escape.fix_text_escapes(txt, quote_char)
+        return _TEXT_ESC_RE.sub(_text_escape_subf, txt)
 
     def fix_re_escapes(self, txt: str) -> str:
         """ The ShEx RE engine allows escaping any character.  We have to remove that escape for everything except those
@@ -206,12 +284,8 @@ class ParserContext:
 
         :param txt: text to be escaped
         """
-        def _subf(matchobj):
-            # o = self.fix_text_escapes(matchobj.group(0))
-            o = matchobj.group(0).translate(self.re_trans_table)
-            if o[1] in '\b\f\n\t\r':
-                return o[0] + 'bfntr'['\b\f\n\t\r'.index(o[1])]
-            else:
-                return o if o[1] in '\\.?*+^$()[]{|}' else o[1]
-
-        return re.sub(r'\\.', _subf, txt, flags=re.MULTILINE + re.DOTALL + re.UNICODE)
+        if '\\' not in txt:
+            return txt
+        if _escape:
+            return _escape.fix_re_escapes(txt)
+        return _ESC_RE.sub(_re_escape_subf, txt)
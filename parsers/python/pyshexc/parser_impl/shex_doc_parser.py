@@ -55,9 +55,9 @@ class ShexDocParser(ShExDocVisitor):
     def visitPrefixDecl(self, ctx: ShExDocParser.PrefixDeclContext):
         """ prefixDecl: KW_PREFIX PNAME_NS IRIREF """
         iri = self.context.iriref_to_shexj_iriref(ctx.IRIREF())
-        prefix = ctx.PNAME_NS().getText()
+        prefix = ctx.PNAME_NS().getText()[:-1]
         if iri not in self.context.ld_prefixes:
-            self.context.prefixes.setdefault(prefix, iri.val)
+            self.context.add_prefix(prefix, iri.val)
 
     def visitStart(self, ctx: ShExDocParser.StartContext):
         """ start: KW_START '=' shapeExpression """
@@ -1,8 +1,16 @@
 import sys
 try:
-    from setuptools import setup
+    from setuptools import setup, Extension
 except ImportError:
-    from distutils.core import setup
+    from distutils.core import setup, Extension
+
+# The compiled escape scanner is optional - pyshexc falls back to pure Python if it isn't built
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize([Extension('pyshexc.parser_impl._escape', ['pyshexc/parser_impl/_escape.pyx'],
+                                       optional=True)])
+except ImportError:
+    ext_modules = []
 
 # typing library was introduced as a core module in version 3.5.0
 # NOTE: the antlr4-python3-runtime must be the same version that was used to create the parser library
@@ -26,6 +34,7 @@ setup(
     description='"PyShExC - a Python ShExC parser',
     long_description='PyShExC - a ShExC to PyJSG, ShExJ and ShExR parser',
     install_requires=requires,
+    ext_modules=ext_modules,
     tests_require=['yadict-compare>=1.1.2'],
     scripts=['scripts/shexc_to_shexj'],
     classifiers=[
@@ -33,5 +42,6 @@ setup(
         'Environment :: Console',
         'Intended Audience :: Developers',
         'Topic :: Software Development :: Compilers',
-        'Programming Language :: Python :: 3 :: Only'],
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: Implementation :: CPython'],
 )
@@ -0,0 +1,147 @@
+# Copyright (c) 2018, Mayo Clinic
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+#     list of conditions and the following disclaimer.
+#
+#     Redistributions in binary form must reproduce the above copyright notice,
+#     this list of conditions and the following disclaimer in the documentation
+#     and/or other materials provided with the distribution.
+#
+#     Neither the name of the Mayo Clinic nor the names of its contributors
+#     may be used to endorse or promote products derived from this software
+#     without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT,
+# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, 
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+import unittest
+from unittest.mock import patch
+
+from ShExJSG import ShExJ
+
+from pyshexc.parser_impl import parser_context
+from pyshexc.parser_impl.generate_shexj import parse
+from pyshexc.parser_impl.parser_context import ParserContext
+
+ESCAPE_SAMPLES = ['', 'plain', r'a\tb\nc\rd\be\ff', r'\\\'\"', r"x\'y", 'a\\\tb\\\nc', r'\.\?\*\+\^\$\(\)\[\]\{\|\}',
+                  r'\/\-\d\u00E9', 'tr\\', 'é\\é\U0001F600', r'\U0001F600\\u00e9\u00eX\U0001F60', r'\q\u',
+                  r'\U00110000', r'\UFFFFFFFF']
+
+
+def escape_implementations():
+    """ Generate the escape implementations to test - the compiled one (if built), then the pure Python one """
+    if parser_context._escape is not None:
+        yield 'compiled'
+    with patch.object(parser_context, '_escape', None):
+        yield 'python'
+
+
+class ParserContextTestCase(unittest.TestCase):
+    def test_text_escapes(self):
+        for impl in escape_implementations():
+            with self.subTest(impl=impl):
+                self._test_text_escapes()
+
+    def _test_text_escapes(self):
+        ctx = ParserContext()
+        self.assertEqual('a\tb\nc\rd\be\ff', ctx.fix_text_escapes(r'a\tb\nc\rd\be\ff', ''))
+        self.assertEqual('a\\b"c\'d', ctx.fix_text_escapes(r'a\\b\"c\'d', ''))
+        self.assertEqual("x'y", ctx.fix_text_escapes(r"x\'y", "'"))
+        self.assertEqual('no escapes', ctx.fix_text_escapes('no escapes', '"'))
+        self.assertEqual('caf\u00e9 x\U0001F600', ctx.fix_text_escapes(r'caf\u00E9 x\U0001F600', '"'))
+        self.assertEqual(r'\u00E9', ctx.fix_text_escapes(r'\\u00E9', '"'))
+        self.assertEqual(r'\u00Ex \q', ctx.fix_text_escapes(r'\u00Ex \q', '"'))
+        self.assertEqual(r'x\U00110000', ctx.fix_text_escapes(r'x\U00110000', '"'))
+        self.assertEqual(r'x\UFFFFFFFF', ctx.fix_text_escapes(r'x\UFFFFFFFF', '"'))
+
+    def test_re_escapes(self):
+        for impl in escape_implementations():
+            with self.subTest(impl=impl):
+                self._test_re_escapes()
+
+    def _test_re_escapes(self):
+        ctx = ParserContext()
+        self.assertEqual(r'a\.b/c\t\n\\-', ctx.fix_re_escapes(r'a\.b\/c\t\n\\\-'))
+        self.assertEqual(r'\t\n\r', ctx.fix_re_escapes('\\\t\\\n\\\r'))
+        self.assertEqual(r'\?\*\+\^\$\(\)\[\]\{\|\}', ctx.fix_re_escapes(r'\?\*\+\^\$\(\)\[\]\{\|\}'))
+        self.assertEqual('é', ctx.fix_re_escapes('\\é'))
+
+    def test_literal_escapes(self):
+        shex: ShExJ.Schema = parse(r'<S> {<p> ["a\tb\n\"q\"" ' + r"'x\'y']}")
+        values = shex.shapes[0].expression.valueExpr.values
+        self.assertEqual('a\tb\n"q"', str(values[0].value))
+        self.assertEqual("x'y", str(values[1].value))
+
+    def test_literal_echar_escapes(self):
+        """ Every ECHAR, as in shexTest 1val1STRING_LITERAL1_with_ECHAR_escapes """
+        shex: ShExJ.Schema = parse(r"<S> {<p> ['ab\t\b\n\r\f\"\'\\cd']}")
+        self.assertEqual('ab\t\b\n\r\f"\'\\cd', str(shex.shapes[0].expression.valueExpr.values[0].value))
+
+    def test_literal_uchars(self):
+        for impl in escape_implementations():
+            with self.subTest(impl=impl):
+                shex: ShExJ.Schema = parse(r'<S> {<p> ["caf\u00E9" "x\U0001F600" """\u00e9\\u00e9"""]}')
+                values = shex.shapes[0].expression.valueExpr.values
+                self.assertEqual('caf\u00e9', str(values[0].value))
+                self.assertEqual('x\U0001F600', str(values[1].value))
+                self.assertEqual('\u00e9\\u00e9', str(values[2].value))
+
+    def test_literal_uchar_out_of_range(self):
+        for impl in escape_implementations():
+            with self.subTest(impl=impl):
+                shex: ShExJ.Schema = parse(r'<S> {<p> ["x\U00110000" "x\UFFFFFFFF"]}')
+                values = shex.shapes[0].expression.valueExpr.values
+                self.assertEqual(r'x\U00110000', str(values[0].value))
+                self.assertEqual(r'x\UFFFFFFFF', str(values[1].value))
+
+    def test_iriref_uchars(self):
+        shex: ShExJ.Schema = parse(r'<http://a.example/S\u00E9> {<http://a.example/p\U000000e9é> .}')
+        self.assertEqual('http://a.example/S\u00e9', str(shex.shapes[0].id))
+        self.assertEqual('http://a.example/p\u00e9\u00e9', str(shex.shapes[0].expression.predicate))
+        for iri in (r'http://a.example/S\U00110000', r'http://a.example/S\UFFFFFFFF'):
+            with self.assertRaisesRegex(ValueError, 'not in range'):
+                parse('<' + iri + '> {}')
+
+    def test_iriref_sharing(self):
+        """ IRIREFs are shared within a schema but never between schemas """
+        shex_str = '<http://a.example/S> {<http://a.example/p> @<http://a.example/S>}'
+        shex1: ShExJ.Schema = parse(shex_str)
+        shex2: ShExJ.Schema = parse(shex_str)
+        self.assertIs(shex1.shapes[0].id, shex1.shapes[0].expression.valueExpr)
+        self.assertIsNot(shex1.shapes[0].id, shex2.shapes[0].id)
+        shex1.shapes[0].id.val = 'http://a.example/T'
+        self.assertEqual('http://a.example/S', str(shex2.shapes[0].id))
+
+    def test_add_prefix(self):
+        ctx = ParserContext()
+        ctx.add_prefix('ex', 'http://a.example/' + 'ns#')
+        ctx.add_prefix('ex', 'http://b.example/ns#')
+        self.assertEqual({'ex': 'http://a.example/ns#'}, ctx.prefixes)
+        self.assertEqual('http://a.example/ns#', ctx._lookup_prefix('ex'))
+        self.assertIs(sys.intern('http://a.example/ns#'), ctx.prefixes['ex'])
+
+    @unittest.skipIf(parser_context._escape is None, "compiled _escape module not built")
+    def test_compiled_escapes(self):
+        ctx = ParserContext()
+        for txt in ESCAPE_SAMPLES:
+            compiled = [ctx.fix_text_escapes(txt, q) for q in ('', "'", '"')] + [ctx.fix_re_escapes(txt)]
+            with patch.object(parser_context, '_escape', None):
+                python = [ctx.fix_text_escapes(txt, q) for q in ('', "'", '"')] + [ctx.fix_re_escapes(txt)]
+            self.assertEqual(python, compiled, txt)
+
+
+if __name__ == '__main__':
+    unittest.main()